@@ -0,0 +1,241 @@
+import time
+import asyncio
+import tempfile
+import httpx
+import hishel
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+# Helpers shared by the Fbref, Fotmob and Sofascore modules
+
+
+# Directory where the CSV files and caches are written
+_DATA_DIR = Path('data')
+_DATA_DIR.mkdir(exist_ok=True)
+
+# Settings for the concurrent requests
+_CONCURRENCY = 10  # Maximum number of requests in flight at the same time
+_HTTP_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=20)
+_HTTP_TIMEOUT = httpx.Timeout(15.0)
+
+# Formats the tables can be exported to
+_OUTPUT_FORMATS = ('csv', 'parquet')
+
+# On-disk cache of the responses, so re-runs within the hour skip the network
+_HTTP_CACHE = _DATA_DIR / '.http_cache'
+_HTTP_CACHE_EXPIRE = 3600  # Seconds
+
+
+def _run(coro):
+    """
+    Runs a coroutine to completion and returns its result.
+
+    When called from a running event loop (e.g. a Jupyter notebook), the coroutine is run
+    in a separate thread with its own loop.
+
+    Args:
+        coro (coroutine): The coroutine to run.
+
+    Returns:
+        The value returned by the coroutine.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+async def _fetch(client, url, limiter=None):
+    """
+    Fetches a page with the given client.
+
+    Args:
+        client (httpx.AsyncClient): The client used to perform the request.
+        url (str): The URL of the page.
+        limiter (AsyncRateLimiter): Rate limiter of the host, if any.
+
+    Returns:
+        str: The content of the page.
+    """
+    if limiter:
+        await limiter.acquire()  # Respect the rate limit of the host
+
+    response = await client.get(url)
+    response.raise_for_status()  # Raise an exception for HTTP errors
+    return response.text
+
+
+async def _fetch_all(urls, delay):
+    """
+    Fetches a list of pages concurrently, with at most _CONCURRENCY requests in flight.
+
+    Args:
+        urls (list of str): The URLs of the pages.
+        delay (int): Delay in seconds between requests to avoid hitting rate limits.
+
+    Returns:
+        list: The content of each page, or the exception raised while fetching it, in the same order as `urls`.
+    """
+    sem = asyncio.Semaphore(_CONCURRENCY)
+    limiter = AsyncRateLimiter(1 / delay) if delay else None  # A single host is scraped per module
+
+    storage = hishel.AsyncFileStorage(base_path=_HTTP_CACHE, ttl=_HTTP_CACHE_EXPIRE)
+    controller = hishel.Controller(force_cache=True)
+
+    async with hishel.AsyncCacheClient(
+        storage=storage,
+        controller=controller,
+        limits=_HTTP_LIMITS,
+        timeout=_HTTP_TIMEOUT,
+        follow_redirects=True
+    ) as client:
+
+        async def fetch(url):
+            async with sem:
+                return await _fetch(client, url, limiter)
+
+        return await asyncio.gather(*(fetch(url) for url in urls), return_exceptions=True)
+
+
+def _check_output_format(output_format):
+    """
+    Checks that a table can be exported to the given format.
+
+    Args:
+        output_format (str): The format of the exported file.
+
+    Raises:
+        ValueError: If the format is not one of _OUTPUT_FORMATS.
+    """
+    if output_format not in _OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected 'csv' or 'parquet'")
+
+
+def _write_output(df, name, output_format='csv'):
+    """
+    Writes a DataFrame to the data directory in the requested format.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to write.
+        name (str): Name of the file, without extension.
+        output_format (str): 'csv', or 'parquet' for a zstd-compressed Parquet file. Default is 'csv'.
+    """
+    _check_output_format(output_format)
+
+    if output_format == 'parquet':
+        df.to_parquet(_DATA_DIR / f'{name}.parquet', engine='pyarrow', compression='zstd', index=False)
+    else:
+        df.to_csv(_DATA_DIR / f'{name}.csv', index=False, encoding='utf-8', lineterminator='\n')
+
+
+class CsvChunkWriter:
+    """
+    Streams DataFrames to a CSV file whose header is the union of their columns.
+
+    Each DataFrame is spooled to its own temporary file as soon as it is written, so only one
+    is kept in memory. The CSV file is assembled when the writer is closed, once the full set of
+    columns is known, so columns that only appear in later DataFrames are not dropped.
+
+    Columns are matched by name and occurrence, so tables that repeat a name (e.g. the totals
+    and the per 90 minutes blocks of the Fbref squads) keep every copy.
+
+    Args:
+        file (str or Path): The path of the CSV file.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.columns = []  # Names of the header, repeated names included
+        self._keys = []  # (name, occurrence) of each column of the header
+        self._chunks = []  # (path, positions in the header, number of rows) of each DataFrame
+        self._spool = tempfile.TemporaryDirectory()
+
+    def write(self, df):
+        """
+        Spools a DataFrame and adds its new columns to the header.
+
+        Args:
+            df (pd.DataFrame): The DataFrame to write.
+        """
+        seen = {}
+        positions = []
+
+        for column in map(str, df.columns):
+            key = (column, seen.get(column, 0))
+            seen[column] = key[1] + 1
+
+            if key not in self._keys:
+                self._keys.append(key)
+                self.columns.append(column)
+            positions.append(self._keys.index(key))
+
+        chunk = Path(self._spool.name) / f'{len(self._chunks)}.csv'
+        df.to_csv(chunk, index=False, header=False, encoding='utf-8')
+        self._chunks.append((chunk, positions, len(df)))
+
+    def close(self):
+        """
+        Writes the spooled DataFrames to the CSV file, aligned to the union of their columns.
+        """
+        try:
+            if not self.columns:
+                open(self.file, 'w').close()
+                return
+
+            pd.DataFrame(columns=self.columns).to_csv(self.file, index=False, encoding='utf-8')
+
+            for chunk, positions, rows in self._chunks:
+                if not rows or not positions:
+                    continue
+
+                # Read the values back as text, so they are copied to the file unchanged
+                df = pd.read_csv(chunk, header=None, names=positions, dtype=str, keep_default_na=False, skip_blank_lines=False)
+                df = df.reindex(columns=range(len(self.columns)), fill_value='')
+                df.to_csv(self.file, mode='a', index=False, header=False, encoding='utf-8')
+
+        finally:
+            self._spool.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncRateLimiter:
+    """
+    Token-bucket rate limiter shared by the concurrent requests to a host.
+
+    The limiter is bound to the event loop it is first used in, so a new one is created for each run.
+
+    Args:
+        rate (float): Number of requests allowed per second.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = 1
+        self.last_refill = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Waits until a request can be performed without exceeding the rate.
+        """
+        async with self.lock:
+            now = time.monotonic()
+            self.tokens = min(1, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.last_refill = time.monotonic()
+                self.tokens = 1
+
+            self.tokens -= 1
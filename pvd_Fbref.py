@@ -1,12 +1,40 @@
 import os
-import time
 import re
+import requests_cache
+import lxml.html
 import numpy as np
-import requests
 import pandas as pd
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from io import StringIO
+from _pvd_utils import _DATA_DIR, _HTTP_CACHE, _HTTP_CACHE_EXPIRE, _run, _fetch_all, CsvChunkWriter
+
+
+# Patterns to extract the table name from the ID of the stats tables
+_TABLE_RE = re.compile(r'(.+)(_for|_against)')
+_PREFIX_RE = re.compile(r'^stats_squads_')
+
+# Columns of the exported tables
+_FBREF_TEAM_COLS = ('name', 'id', 'logo', 'league', 'league_id', 'country', 'season', 'link')
+_FBREF_PLAYER_COLS = ('player', 'id', 'profile', 'team', 'league', 'season', 'country', 'link')
+
+# Session shared by the sequential requests, so the connection to the host is reused
+_FBREF_SESSION = requests_cache.CachedSession(
+    _HTTP_CACHE,
+    backend='sqlite',
+    expire_after=_HTTP_CACHE_EXPIRE,
+    allowable_methods=('GET',),
+    cache_control=True
+)
+_FBREF_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+))
+
 
 # Main functions
 
@@ -22,7 +50,7 @@ def get_teams_from_league(league_url):
         list: A list of dictionaries, each containing information about a team.
     """
     teams_dic = []  # List to store team information
-    repeated = []  # List to keep track of processed links
+    repeated = set()  # Set to keep track of processed links
 
     # Extract league_id and season from the URL
     parts = league_url.rstrip('/').split('/')
@@ -33,43 +61,36 @@ def get_teams_from_league(league_url):
     country = final[-1]
 
     # Get the HTML page
-    response = requests.get(league_url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    response = _FBREF_SESSION.get(league_url, timeout=15)
+    tree = lxml.html.fromstring(response.content)
 
-    # Find the specific container by its ID
-    table_container = soup.find('div', id='div_results2024211_overall')
+    # Find all team links within the specific container by its ID
+    hrefs = tree.xpath('//div[@id="div_results2024211_overall"]//a[contains(@href, "/es/equipos/")]/@href')
 
-    if table_container:
-        links = table_container.find_all('a', href=True)  # Find all links within the container
+    for href in hrefs:
+        if href not in repeated:
+            repeated.add(href)
 
-        for link in links:
-            href = link['href']
+            team_name = href.rstrip('/').split('/')[-1].replace('Estadisticas-de-', '').replace('-', ' ')
+            team_id = href.rstrip('/').split('/')[-2]
+            full_link = 'https://www.fbref.com' + href
 
-            if href not in repeated:
-                repeated.append(href)
-
-                if '/es/equipos/' in href:
-                    team_name = href.rstrip('/').split('/')[-1].replace('Estadisticas-de-', '').replace('-', ' ')
-                    team_id = href.rstrip('/').split('/')[-2]
-                    full_link = 'https://www.fbref.com' + href
-
-                    teams_info = {
-                        'name': team_name,
-                        'id': team_id,
-                        'logo': f'https://cdn.ssref.net/req/202408052/tlogo/fb/{team_id}.png',
-                        'league': league,
-                        'league_id': league_id,
-                        'country': country,
-                        'season': season,
-                        'link': full_link
-                    }
-
-                    teams_dic.append(teams_info)
+            teams_info = {
+                'name': team_name,
+                'id': team_id,
+                'logo': f'https://cdn.ssref.net/req/202408052/tlogo/fb/{team_id}.png',
+                'league': league,
+                'league_id': league_id,
+                'country': country,
+                'season': season,
+                'link': full_link
+            }
+
+            teams_dic.append(teams_info)
 
     # Export to CSV
-    os.makedirs('data', exist_ok=True)  # Create the 'data' directory if it doesn't exist
-    teams_df = pd.DataFrame(teams_dic)
-    teams_df.to_csv('data/fbref_teams.csv', index=False, encoding='utf-8')
+    teams_df = pd.DataFrame.from_records(teams_dic, columns=_FBREF_TEAM_COLS)
+    teams_df.to_csv(_DATA_DIR / 'fbref_teams.csv', index=False, encoding='utf-8')
 
     return teams_dic
 
@@ -92,8 +113,10 @@ def get_standings_from_league(league_url):
     country = final[-1]
     
     try:
-        # Read the standings table from the specified URL with the given ID
-        standings_df = pd.read_html(league_url, attrs={'id': f'results{season}{league_id}1_overall'})[0]
+        # Read the standings table from the league page with the given ID
+        response = _FBREF_SESSION.get(league_url, timeout=15)
+        response.raise_for_status()
+        standings_df = pd.read_html(StringIO(response.text), attrs={'id': f'results{season}{league_id}1_overall'})[0]
         
         standings_df['league'] = league
         standings_df['season'] = season
@@ -102,8 +125,7 @@ def get_standings_from_league(league_url):
         standings_df.rename(columns={'Equipo': 'team'}, inplace=True)
     
         # Export to CSV
-        os.makedirs('data', exist_ok=True)  # Create the 'data' directory if it doesn't exist
-        standings_df.to_csv('data/fbref_standings.csv', index=False, encoding='utf-8')
+        standings_df.to_csv(_DATA_DIR / 'fbref_standings.csv', index=False, encoding='utf-8')
 
         return standings_df
 
@@ -118,7 +140,7 @@ def get_stats_from_league(league_url, delay=10):
 
     Args:
         league_url (str): URL of the league page containing the statistics tables.
-        delay (int): Delay in seconds between requests to avoid hitting rate limits.
+        delay (int): Unused, the league page is requested only once. Kept for backward compatibility.
 
     Returns:
         pd.DataFrame: A DataFrame containing all the statistics data.
@@ -145,56 +167,36 @@ def get_stats_from_league(league_url, delay=10):
         'stats_squads_misc_for', 'stats_squads_misc_against'
     )
 
-    dfs = []
 
-    for table_id in table_ids:
-        time.sleep(delay)  # Respect the delay between requests
-        
-        try:
-            # Read the table from the URL using the ID
-            df = pd.read_html(league_url, attrs={'id': table_id})[0]
-
-            # Flatten multi-level columns if present
-            if isinstance(df.columns, pd.MultiIndex):
-                df.columns = ['_'.join(col).strip() if 'Unnamed' not in col[0] else col[1] for col in df.columns]
-
-            # Melt the DataFrame to long format
-            df_pivot = df.melt(id_vars=['Equipo'], var_name='stat', value_name='value')
-
-            # Split 'stat' into 'class' and 'stat' if applicable
-            if df_pivot['stat'].str.contains('_').any():
-                df_pivot[['class', 'stat']] = df_pivot['stat'].str.split('_', expand=True, n=1)
-            else:
-                df_pivot['stat'] = ''
-                df_pivot['class'] = df_pivot['stat']
-
-            # Update 'stat' and 'class' columns
-            df_pivot['stat'] = df_pivot.apply(lambda row: row['class'] if pd.isna(row['stat']) else row['stat'], axis=1)
-            df_pivot['class'] = df_pivot.apply(lambda row: np.nan if row['stat'] == row['class'] else row['class'], axis=1)
-
-            # Extract table name and target ('for' or 'against')
-            table_match = re.match(r'(.+)(_for|_against)', table_id)
-            table_name = re.sub(r'stats_squads_', '', table_match.group(1)) if table_match else ''
-            table_name = table_name.replace('_', ' ').title()
-
-            df_pivot['table'] = table_name
-            df_pivot['target'] = 'for' if '_for' in table_id else 'against' if '_against' in table_id else None
-            df_pivot['target'] = df_pivot['target'].str.title()
-            df_pivot['league'] = league
-            df_pivot['country'] = country
-            df_pivot['season'] = season
-            df_pivot.rename(columns={'Equipo': 'team'}, inplace=True)
-            
-            # Append the DataFrame to the list
-            dfs.append(df_pivot)
-
-        except Exception as e:
-            print(f"Error processing ID {table_id}: {e}")
-
-    # Combine all DataFrames and export to CSV
-    os.makedirs('data', exist_ok=True)  # Create the 'data' directory if it doesn't exist
-    stats_df = pd.concat(dfs, ignore_index=True)
-    stats_df.to_csv('data/fbref_stats.csv', index=False, encoding='utf-8')
+    # Fetch and parse the league page once, all the tables are taken from the same tree
+    response = _FBREF_SESSION.get(league_url, timeout=30)
+    response.raise_for_status()
+    tree = lxml.html.fromstring(response.content)
+
+    # Parse the tables in parallel, each worker process takes one table
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = {}
+
+        for table_id in table_ids:
+            try:
+                # Extract the table from the page using the ID
+                table_html = lxml.html.tostring(tree.get_element_by_id(table_id), encoding='unicode')
+                futures[table_id] = executor.submit(_parse_stats_table, table_html, table_id, league, country, season)
+
+            except Exception as e:
+                print(f"Error processing ID {table_id}: {e}")
+
+        # Write each DataFrame to the CSV file as soon as it is ready
+        with CsvChunkWriter(_DATA_DIR / 'fbref_stats.csv') as writer:
+            for table_id, future in futures.items():
+                try:
+                    writer.write(future.result())
+
+                except Exception as e:
+                    print(f"Error processing ID {table_id}: {e}")
+
+    # Read the combined data back from the CSV file
+    stats_df = pd.read_csv(_DATA_DIR / 'fbref_stats.csv') if writer.columns else pd.DataFrame()
 
     return stats_df
 
@@ -210,11 +212,20 @@ def get_players_from_teams(teams, delay=10):
     Returns:
         list: A list of dictionaries, each containing information about a player.
     """
+    return _run(_get_players_from_teams_async(teams, delay))
+
+
+async def _get_players_from_teams_async(teams, delay):
     players_dic = []  # List to store player information
-    repeated = []  # List to keep track of processed links
+    repeated = set()  # Set to keep track of processed links
+
+    # Fetch the team pages concurrently
+    pages = await _fetch_all([team['link'] for team in teams], delay)
 
-    for team in teams:
-        time.sleep(delay)  # Respect the delay between requests
+    for team, html in zip(teams, pages):
+        if isinstance(html, Exception):
+            print(f"Error processing team {team['name']} at {team['link']}: {html}")
+            continue
 
         # Extract team information
         team_name = team['name']
@@ -222,44 +233,34 @@ def get_players_from_teams(teams, delay=10):
         league = team['league']
         country = team['country']
 
-        # Get the HTML page for the team's players
-        response = requests.get(team['link'])
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        # Find the specific container by its ID
-        table_container = soup.find('div', id='all_stats_standard')
-
-        if table_container:
-            links = table_container.find_all('a', href=True)  # Find all links within the container
-
-            for link in links:
-                href = link['href']
+        # Parse the HTML page and find all player links within the specific container by its ID, excluding 'summary' links
+        tree = lxml.html.fromstring(html)
+        hrefs = tree.xpath('//div[@id="all_stats_standard"]//a[contains(@href, "/es/jugadores/") and not(contains(@href, "summary"))]/@href')
 
-                if href not in repeated and 'summary' not in href:  # Exclude links containing 'summary'
-                    repeated.append(href)
+        for href in hrefs:
+            if href not in repeated:
+                repeated.add(href)
 
-                    if '/es/jugadores/' in href:
-                        player_name = href.rstrip('/').split('/')[-1].replace('-', ' ')
-                        player_id = href.rstrip('/').split('/')[-2]
-                        full_link = 'https://www.fbref.com' + href
+                player_name = href.rstrip('/').split('/')[-1].replace('-', ' ')
+                player_id = href.rstrip('/').split('/')[-2]
+                full_link = 'https://www.fbref.com' + href
 
-                        players_info = {
-                            'player': player_name,
-                            'id': player_id,
-                            'profile': f'https://fbref.com/req/202302030/images/headshots/{player_id}_2022.jpg',
-                            'team': team_name,
-                            'league': league,
-                            'season': season,
-                            'country': country,
-                            'link': full_link
-                        }
+                players_info = {
+                    'player': player_name,
+                    'id': player_id,
+                    'profile': f'https://fbref.com/req/202302030/images/headshots/{player_id}_2022.jpg',
+                    'team': team_name,
+                    'league': league,
+                    'season': season,
+                    'country': country,
+                    'link': full_link
+                }
 
-                        players_dic.append(players_info)
+                players_dic.append(players_info)
 
     # Export to CSV
-    os.makedirs('data', exist_ok=True)  # Create the 'data' directory if it doesn't exist
-    players_df = pd.DataFrame(players_dic)
-    players_df.to_csv('data/fbref_players.csv', index=False, encoding='utf-8')
+    players_df = pd.DataFrame.from_records(players_dic, columns=_FBREF_PLAYER_COLS)
+    players_df.to_csv(_DATA_DIR / 'fbref_players.csv', index=False, encoding='utf-8')
 
     return players_dic
 
@@ -275,51 +276,36 @@ def get_squads_from_teams(teams, delay=10):
     Returns:
         pd.DataFrame: A DataFrame containing the combined squad data for all teams.
     """
-    dfs = []
-
-    for team in teams:
-        time.sleep(delay)  # Respect delay between requests
-
-        season = team['season']
-        league = team['league']
-        country = team['country']
-        id = 'stats_standard_' + team['league_id']
-
-        try:
-            # Read the squad table from the specified URL with the given ID
-            df = pd.read_html(team['link'], attrs={'id': id})[0]
+    return _run(_get_squads_from_teams_async(teams, delay))
 
-            df.columns = df.columns.get_level_values(1)
 
-            # Process the 'Edad' column to convert age ranges to average age in years
-            df['Edad'] = df['Edad'].apply(
-                lambda x: float(x.rstrip('-').split('-')[0]) + float(x.rstrip('-').split('-')[1])/365
-                if isinstance(x, str) and '-' in x else x
-            )
-            df['Edad'] = pd.to_numeric(df['Edad'], errors='coerce')
+async def _get_squads_from_teams_async(teams, delay):
 
-            # Drop rows with NaN values in the 'Edad' column
-            squad_df = df.dropna(subset=['Edad']).copy()
+    # Fetch the team pages concurrently
+    pages = await _fetch_all([team['link'] for team in teams], delay)
 
-            # Extract the last 3 characters from the 'País' column to get the country code
-            squad_df['País'] = squad_df['País'].apply(lambda x: str(x)[-3:])
+    # Parse the pages in parallel, each worker process takes one page
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = [
+            executor.submit(_parse_squad_table, html, 'stats_standard_' + team['league_id'], team)
+            if not isinstance(html, Exception) else html
+            for team, html in zip(teams, pages)
+        ]
 
-            # Rename columns and add additional team information
-            squad_df.rename(columns={'Jugador': 'player'}, inplace=True)
-            squad_df['league'] = league
-            squad_df['season'] = season
-            squad_df['team'] = team['name']
-            squad_df['country'] = country
+        # Write each DataFrame to the CSV file as soon as it is ready
+        with CsvChunkWriter(_DATA_DIR / 'fbref_squads.csv') as writer:
+            for team, future in zip(teams, futures):
+                try:
+                    if isinstance(future, Exception):
+                        raise future
 
-            dfs.append(squad_df)
+                    writer.write(future.result())
 
-        except Exception as e:
-            print(f"Error processing team {team['name']} at {team['link']}: {e}")
+                except Exception as e:
+                    print(f"Error processing team {team['name']} at {team['link']}: {e}")
 
-    # Export all DataFrames to a CSV file
-    os.makedirs('data', exist_ok=True)  # Create the 'data' directory if it doesn't exist
-    squads_df = pd.concat(dfs, ignore_index=True)
-    squads_df.to_csv('data/fbref_squads.csv', index=False, encoding='utf-8')
+    # Read the combined data back from the CSV file
+    squads_df = pd.read_csv(_DATA_DIR / 'fbref_squads.csv') if writer.columns else pd.DataFrame()
 
     return squads_df
 
@@ -336,53 +322,155 @@ def get_percentile_from_players(players, delay=10, language='ES'):
     Returns:
         pd.DataFrame: A DataFrame containing the combined percentile data for all players.
     """
-    dfs = []
+    return _run(_get_percentile_from_players_async(players, delay, language))
 
-    for player in players:
-        time.sleep(delay)  # Respect delay between requests
 
-        try:
-            # Retrieve the content of the player's page
-            response = requests.get(player['link'])
-            soup = BeautifulSoup(response.content, 'html.parser')
+async def _get_percentile_from_players_async(players, delay, language):
 
-            # Find the table with an id that starts with 'scout_summary_'
-            table = soup.find('table', id=lambda x: x and x.startswith('scout_summary_'))
+    # Fetch the player pages concurrently
+    pages = await _fetch_all([player['link'] for player in players], delay)
 
-            if table:
-                # Read the table into a DataFrame
-                df = pd.read_html(StringIO(str(table)))[0]
+    # Write each DataFrame to the CSV file as soon as it is ready
+    with CsvChunkWriter(_DATA_DIR / 'fbref_percentiles.csv') as writer:
+        for player, html in zip(players, pages):
+            try:
+                if isinstance(html, Exception):
+                    raise html
 
-                # Determine the bins and labels based on the statistics type
-                if df.loc[0, 'Estadísticas'] == 'PSxG-GA':
-                    bins = [0, 6, 11, 15]
-                    if language == 'ES':
-                        labels = ['Portería', 'Colectiva', 'Defensiva']
-                    else:
-                        labels = ['Keeper', 'Passing', 'Defensive']
-                else:
-                    bins = [0, 7, 15, 21]
-                    if language == 'ES':
-                        labels = ['Ofensiva', 'Colectiva', 'Defensiva']
+                # Parse the content of the player's page
+                soup = BeautifulSoup(html, 'html.parser')
+
+                # Find the table with an id that starts with 'scout_summary_'
+                table = soup.find('table', id=lambda x: x and x.startswith('scout_summary_'))
+
+                if table:
+                    # Read the table into a DataFrame
+                    df = pd.read_html(StringIO(str(table)))[0]
+
+                    # Determine the bins and labels based on the statistics type
+                    if df.loc[0, 'Estadísticas'] == 'PSxG-GA':
+                        bins = [0, 6, 11, 15]
+                        if language == 'ES':
+                            labels = ['Portería', 'Colectiva', 'Defensiva']
+                        else:
+                            labels = ['Keeper', 'Passing', 'Defensive']
                     else:
-                        labels = ['Offensive', 'Passing', 'Defensive']
+                        bins = [0, 7, 15, 21]
+                        if language == 'ES':
+                            labels = ['Ofensiva', 'Colectiva', 'Defensiva']
+                        else:
+                            labels = ['Offensive', 'Passing', 'Defensive']
 
-                # Clean the DataFrame
-                df = df.dropna(how='all')
-                df['player'] = player['player']
-                df['player_id'] = player['id']
+                    # Clean the DataFrame
+                    df = df.dropna(how='all')
+                    df['player'] = player['player']
+                    df['player_id'] = player['id']
 
-                # Create a column with category labels based on the bins
-                df['clase'] = pd.cut(df.index, bins=bins, labels=labels, right=False)
+                    # Create a column with category labels based on the bins
+                    df['clase'] = pd.cut(df.index, bins=bins, labels=labels, right=False)
 
-                dfs.append(df)
-            
-        except Exception as e:
-            print(f"Error processing player {player['player']} at {player['link']}: {e}")
+                    writer.write(df)
 
-    # Export all DataFrames to a CSV file
-    os.makedirs('data', exist_ok=True)  # Create the 'data' directory if it doesn't exist
-    percentiles_df = pd.concat(dfs, ignore_index=True)
-    percentiles_df.to_csv('data/fbref_percentiles.csv', index=False, encoding='utf-8')
+            except Exception as e:
+                print(f"Error processing player {player['player']} at {player['link']}: {e}")
+
+    # Read the combined data back from the CSV file
+    percentiles_df = pd.read_csv(_DATA_DIR / 'fbref_percentiles.csv') if writer.columns else pd.DataFrame()
 
     return percentiles_df
+
+
+# Support functions
+
+
+def _parse_stats_table(table_html, table_id, league, country, season):
+    """
+    Reads a squad stats table and converts it to long format. Runs in a worker process.
+
+    Args:
+        table_html (str): The HTML of the table.
+        table_id (str): The ID of the table.
+        league (str): The name of the league.
+        country (str): The country of the league.
+        season (int): The season of the league.
+
+    Returns:
+        pd.DataFrame: A DataFrame with one row per team and statistic.
+    """
+    # Read the table into a DataFrame
+    df = pd.read_html(StringIO(table_html))[0]
+
+    # Take the class from the first level of the columns and the stat from the last
+    # No class for 'Unnamed' groups, nor for groups named like their stat (e.g. Bloqueos/Bloqueos)
+    if isinstance(df.columns, pd.MultiIndex):
+        classes = df.columns.get_level_values(0)
+        stats = df.columns.get_level_values(-1)
+        classes = classes.where(~classes.str.startswith('Unnamed') & (classes != stats))
+    else:
+        classes = pd.Index([np.nan] * len(df.columns), dtype=object)
+        stats = df.columns
+
+    # Build the long format directly, one row per column and team in the same order as DataFrame.melt
+    is_team = np.asarray(stats == 'Equipo')
+    teams = df.loc[:, is_team].iloc[:, 0].to_numpy()
+    values = df.loc[:, ~is_team].to_numpy()
+
+    df_pivot = pd.DataFrame({
+        'team': np.tile(teams, values.shape[1]),
+        'stat': np.repeat(stats[~is_team], len(teams)),
+        'value': values.ravel(order='F'),
+        'class': np.repeat(classes[~is_team], len(teams))
+    })
+
+    # Extract table name and target ('for' or 'against')
+    table_match = _TABLE_RE.match(table_id)
+    table_name = _PREFIX_RE.sub('', table_match.group(1)) if table_match else ''
+    table_name = table_name.replace('_', ' ').title()
+
+    df_pivot['table'] = table_name
+    df_pivot['target'] = 'for' if '_for' in table_id else 'against' if '_against' in table_id else None
+    df_pivot['target'] = df_pivot['target'].str.title()
+    df_pivot['league'] = league
+    df_pivot['country'] = country
+    df_pivot['season'] = season
+
+    return df_pivot
+
+
+def _parse_squad_table(html, table_id, team):
+    """
+    Reads the squad table of a team page and cleans it. Runs in a worker process.
+
+    Args:
+        html (str): The HTML of the team page.
+        table_id (str): The ID of the squad table.
+        team (dict): The team information, with keys such as 'name', 'season', 'league' and 'country'.
+
+    Returns:
+        pd.DataFrame: A DataFrame with one row per player of the squad.
+    """
+    # Read the squad table from the HTML with the given ID
+    df = pd.read_html(StringIO(html), attrs={'id': table_id})[0]
+
+    df.columns = df.columns.get_level_values(1)
+
+    # Process the 'Edad' column to convert age ranges to average age in years
+    age = df['Edad'].astype('string').str.rstrip('-').str.split('-', n=1, expand=True).reindex(columns=[0, 1])
+    years = pd.to_numeric(age[0], errors='coerce')
+    days = pd.to_numeric(age[1], errors='coerce')
+    df['Edad'] = (years + days / 365).fillna(pd.to_numeric(df['Edad'], errors='coerce'))
+
+    # Drop rows with NaN values in the 'Edad' column
+    squad_df = df.dropna(subset=['Edad']).copy()
+
+    # Extract the last 3 characters from the 'País' column to get the country code
+    squad_df['País'] = squad_df['País'].astype('string').str.slice(-3)
+
+    # Rename columns and add additional team information
+    squad_df.rename(columns={'Jugador': 'player'}, inplace=True)
+    squad_df['league'] = team['league']
+    squad_df['season'] = team['season']
+    squad_df['team'] = team['name']
+    squad_df['country'] = team['country']
+
+    return squad_df
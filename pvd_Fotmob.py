@@ -1,9 +1,50 @@
 import pandas as pd
 import requests
+import json
 import time
-import os
-from bs4 import BeautifulSoup
+import atexit
+import functools
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
+from _pvd_utils import _DATA_DIR, _HTTP_CACHE, _HTTP_CACHE_EXPIRE, _run, _fetch_all, CsvChunkWriter
+
+
+# Session shared by the sequential requests, so the connection to the host is reused
+_FOTMOB_SESSION = requests_cache.CachedSession(
+    _HTTP_CACHE,
+    backend='sqlite',
+    expire_after=_HTTP_CACHE_EXPIRE,
+    allowable_methods=('GET',),
+    cache_control=True
+)
+_FOTMOB_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+# Columns of the exported tables
+_FOTMOB_TEAM_COLS = ('team', 'id', 'logo', 'league', 'country', 'season', 'link')
+_FOTMOB_PLAYER_COLS = ('name', 'id', 'profile', 'coach', 'team', 'league', 'season', 'link')
+_FOTMOB_POSITION_COLS = ('player_name', 'player_id', 'pos_id', 'position', 'pos_short', 'occurrences', 'main')
+
+# Player data already fetched, keyed by player ID and persisted across runs
+_PLAYER_DATA_CACHE_FILE = _DATA_DIR / '_fotmob_playerdata_cache.json'
+_PLAYER_DATA_CACHE_EXPIRE = 7 * 24 * 3600  # Seconds
+
+try:
+    with open(_PLAYER_DATA_CACHE_FILE, encoding='utf-8') as cache_file:
+        _PLAYER_DATA_CACHE = json.load(cache_file)
+except (OSError, ValueError):
+    _PLAYER_DATA_CACHE = {}
+
+# Each entry keeps the time it was fetched, drop the expired ones and those without it
+_PLAYER_DATA_CACHE = {
+    player_id: entry for player_id, entry in _PLAYER_DATA_CACHE.items()
+    if isinstance(entry, dict) and time.time() - entry.get('fetched_at', 0) < _PLAYER_DATA_CACHE_EXPIRE
+}
 
 
 # Main functions
@@ -15,7 +56,7 @@ def get_teams_from_league(league_url, delay=5):
 
     Args:
         league_url (str): The URL of the league page on Fotmob.
-        delay (int): The delay (in seconds) between requests to avoid overwhelming the server. Default is 5.
+        delay (int): Unused, the league data is requested only once. Kept for backward compatibility.
 
     Returns:
         list: A list of dictionaries containing team details, including team name, ID, logo URL, league name, country, season, and page link.
@@ -32,43 +73,37 @@ def get_teams_from_league(league_url, delay=5):
 
     try:
         # Perform the GET request
-        response = requests.get(api_url)
+        response = _FOTMOB_SESSION.get(api_url, timeout=15)
         response.raise_for_status()
         data = response.json()
 
         # Extract league information
-        league = data[0]['data']['leagueName']
-        country = data[0]['data']['ccode']
+        league_data = data[0]['data']
+        league = league_data['leagueName']
+        country = league_data['ccode']
         season = datetime.now().year
-
-        time.sleep(delay)  # Respect the delay between requests
+        rows = league_data['table']['all']
 
         # Extract team information
-        for i in range(len(data[0]['data']['table']['all'])):
-            name = data[0]['data']['table']['all'][i]['name']
-            id = data[0]['data']['table']['all'][i]['id']
-            logo = f'https://images.fotmob.com/image_resources/logo/teamlogo/{id}_xsmall.png'
-            link = 'https://www.fotmob.com/es' + data[0]['data']['table']['all'][i]['pageUrl']
-
-            team_info = {
-                'team': name,
-                'id': id,
-                'logo': logo,
+        teams_dic = [
+            {
+                'team': row['name'],
+                'id': row['id'],
+                'logo': f'https://images.fotmob.com/image_resources/logo/teamlogo/{row["id"]}_xsmall.png',
                 'league': league,
                 'country': country,
                 'season': season,
-                'link': link
+                'link': 'https://www.fotmob.com/es' + row['pageUrl']
             }
-
-            teams_dic.append(team_info)
+            for row in rows
+        ]
 
     except requests.exceptions.RequestException as e:
         print(f'Error during request: {e}')
 
     # Export to CSV
-    os.makedirs('data', exist_ok=True)
-    teams_df = pd.DataFrame(teams_dic)
-    teams_df.to_csv('data/fotmob_teams.csv', index=False, encoding='utf-8')
+    teams_df = pd.DataFrame.from_records(teams_dic, columns=_FOTMOB_TEAM_COLS)
+    teams_df.to_csv(_DATA_DIR / 'fotmob_teams.csv', index=False, encoding='utf-8')
 
     return teams_dic
 
@@ -84,54 +119,57 @@ def get_players_from_teams(teams, delay=5):
     Returns:
         list: A list of dictionaries containing player information.
     """
+    return _run(_get_players_from_teams_async(teams, delay))
+
+
+async def _get_players_from_teams_async(teams, delay):
     players_dic = []  # List to store player information
-    repeated = []     # List to keep track of processed player links
+    repeated = set()  # Set to keep track of processed player IDs
 
-    for team in teams:
-        time.sleep(delay)  # Respect the delay between requests
+    # Fetch the squad of every team from the API concurrently
+    urls = [f'https://www.fotmob.com/api/teams?id={team["id"]}' for team in teams]
+    responses = await _fetch_all(urls, delay)
 
-        season = team['season']
-        league = team['league']
-        team_name = team['team']
-        url = team['link'].replace('overview', 'squad')
-       
-        response = requests.get(url)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        links = soup.find_all('a', href=True)
+    for team, text in zip(teams, responses):
+        if isinstance(text, Exception):
+            print(f'Error during request: {text}')
+            continue
 
-        for link in links:
-            href = link['href']
+        try:
+            groups = json.loads(text)['squad']['squad']
+        except (ValueError, KeyError, TypeError) as e:
+            print(f'Error parsing squad of {team["team"]}: {e}')
+            continue
+
+        # Each group holds the members of a role, the coach comes in its own group
+        for group in groups:
+            is_coach = group.get('title') == 'coach'
+
+            for member in group.get('members', []):
+                player_id = member['id']
 
-            if href not in repeated:
-                repeated.append(href)
+                if player_id not in repeated:
+                    repeated.add(player_id)
 
-                if '/es/players/' in href:
-                    full_link = 'https://www.fotmob.com' + href
-                    player_id = href.rstrip('/').split('/')[-2]
+                    slug = member['name'].lower().replace(' ', '-')
+                    full_link = f'https://www.fotmob.com/es/players/{player_id}/{slug}'
                     profile = f'https://www.fotmob.com/_next/image?url=https%3A%2F%2Fimages.fotmob.com%2Fimage_resources%2Fplayerimages%2F{player_id}.png&w=96&q=75'
-                    
-                    data = get_player_data(player_id)
-
-                    if data:
-                        name = data['name']
-                        coach = data['isCoach']
-
-                        player_info = {
-                            'name': name,
-                            'id': player_id,
-                            'profile': profile,
-                            'coach': coach,
-                            'team': team_name,
-                            'league': league,
-                            'season': season,
-                            'link': full_link
-                        }
-                        players_dic.append(player_info)
-    
+
+                    player_info = {
+                        'name': member['name'],
+                        'id': player_id,
+                        'profile': profile,
+                        'coach': is_coach,
+                        'team': team['team'],
+                        'league': team['league'],
+                        'season': team['season'],
+                        'link': full_link
+                    }
+                    players_dic.append(player_info)
+
     # Export to CSV
-    os.makedirs('data', exist_ok=True)  # Create the 'data' directory if it doesn't exist
-    players_df = pd.DataFrame(players_dic)
-    players_df.to_csv('data/fotmob_players.csv', index=False, encoding='utf-8')
+    players_df = pd.DataFrame.from_records(players_dic, columns=_FOTMOB_PLAYER_COLS)
+    players_df.to_csv(_DATA_DIR / 'fotmob_players.csv', index=False, encoding='utf-8')
 
     return players_dic
 
@@ -147,28 +185,32 @@ def get_shotmap_from_players(players, delay=5):
     Returns:
         pd.DataFrame: A DataFrame containing shot map data for all players.
     """
-    dfs = []  # List to store DataFrames for each player's shot map data
+    return _run(_get_shotmap_from_players_async(players, delay))
 
-    for player in players:
-        time.sleep(delay)  # Respect the delay between requests
 
-        try:
-            player_id = player['id']
-            display_season = 0  # Adjust as needed for the actual season ID
-            display_league = 0  # Adjust as needed for the actual league ID
-            
-            # Construct the API URL for the player's shot map data
-            api_url = f'https://www.fotmob.com/api/playerStats?playerId={player_id}&seasonId={display_season}-{display_league}&isFirstSeason=false'
-
-            response = requests.get(api_url)
-            response.raise_for_status()  # Raise an exception for HTTP errors
-            data = response.json()
-        
-            # Convert shot map data to DataFrame           
-            shots = data['shotmap']
-
-            for shot in shots:
-                df = pd.DataFrame(shot)
+async def _get_shotmap_from_players_async(players, delay):
+    display_season = 0  # Adjust as needed for the actual season ID
+    display_league = 0  # Adjust as needed for the actual league ID
+
+    # Construct the API URL for each player's shot map data and fetch them concurrently
+    urls = [
+        f'https://www.fotmob.com/api/playerStats?playerId={player["id"]}&seasonId={display_season}-{display_league}&isFirstSeason=false'
+        for player in players
+    ]
+    responses = await _fetch_all(urls, delay)
+
+    # Write each DataFrame to the CSV file as soon as it is ready
+    with CsvChunkWriter(_DATA_DIR / 'fotmob_shotmap.csv') as writer:
+        for player, text in zip(players, responses):
+            try:
+                if isinstance(text, Exception):
+                    raise text
+
+                data = json.loads(text)
+
+                # Convert the player's shot map data to a single DataFrame, one row per shot
+                shots = [{key: value for key, value in shot.items() if key != 'onGoalShot'} for shot in data['shotmap']]
+                df = pd.DataFrame.from_records(shots)
 
                 # Rename columns and add player info
                 df.rename(columns={'playerName': 'player'}, inplace=True)
@@ -177,19 +219,16 @@ def get_shotmap_from_players(players, delay=5):
                 df['team'] = player['team']
 
                 # Clean DataFrame
-                df.drop(columns=['onGoalShot'], inplace=True)
                 df.drop_duplicates(inplace=True)
 
-                # Append DataFrame to the list
-                dfs.append(df)
-        
-        except:
-            continue
-    
-    # Export all DataFrames to a CSV file
-    os.makedirs('data', exist_ok=True)  # Create the 'data' directory if it doesn't exist
-    shotmap_df = pd.concat(dfs, ignore_index=True)
-    shotmap_df.to_csv('data/fotmob_shotmap.csv', index=False, encoding='utf-8')
+                # Write DataFrame to the CSV file
+                writer.write(df)
+
+            except:
+                continue
+
+    # Read the combined data back from the CSV file
+    shotmap_df = pd.read_csv(_DATA_DIR / 'fotmob_shotmap.csv') if writer.columns else pd.DataFrame()
 
     return shotmap_df
 
@@ -205,18 +244,23 @@ def get_positions_from_players(players, delay=5):
     Returns:
         pd.DataFrame: A DataFrame containing position data for all players.
     """
+    return _run(_get_positions_from_players_async(players, delay))
+
+
+async def _get_positions_from_players_async(players, delay):
     dfs = []  # List to store dictionaries of player position data
 
-    for player in players:
-        time.sleep(delay)  # Respect the delay between requests
+    # Fetch the data of every player concurrently
+    responses = await _get_player_data_many([player['id'] for player in players], delay)
 
+    for player, data in zip(players, responses):
         player_id = player['id']
         player_name = player['name']
-        player_link = player['link']
-
-        data = get_player_data(player_id)
 
         try:
+            if isinstance(data, Exception):
+                raise data
+
             if 'positionDescription' in data and 'positions' in data['positionDescription']:
                 for position_info in data['positionDescription']['positions']:
                     position = position_info['strPos']['label']
@@ -240,9 +284,8 @@ def get_positions_from_players(players, delay=5):
             continue
 
     # Export all DataFrames to a CSV file
-    os.makedirs('data', exist_ok=True)  # Create the 'data' directory if it doesn't exist
-    positions_df = pd.DataFrame(dfs)
-    positions_df.to_csv('data/fotmob_positions.csv', index=False, encoding='utf-8')
+    positions_df = pd.DataFrame.from_records(dfs, columns=_FOTMOB_POSITION_COLS)
+    positions_df.to_csv(_DATA_DIR / 'fotmob_positions.csv', index=False, encoding='utf-8')
 
     return positions_df
 
@@ -255,22 +298,113 @@ def get_player_data(player_id):
     Fetches player data from Fotmob using the player's ID.
 
     Args:
-        id (int): The ID of the player whose data is to be retrieved.
+        player_id (int): The ID of the player whose data is to be retrieved.
+
+    Returns:
+        dict: A dictionary containing the player's data, or None if the request failed.
+    """
+    try:
+        return _get_player_data(str(player_id))
+
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f'Error during request: {e}')
+        return None
+
+
+@functools.lru_cache(maxsize=10_000)
+def _get_player_data(player_id):
+    """
+    Fetches player data from Fotmob, caching the result in memory and in the player data cache file.
+
+    Errors are raised instead of cached, so a failed request is retried on the next call.
+
+    Args:
+        player_id (str): The ID of the player whose data is to be retrieved.
 
     Returns:
         dict: A dictionary containing the player's data.
     """
+    data = _cached_player_data(player_id)
+    if data is not None:
+        return data
+
     # Construct the API URL with the player ID
     api_url = f'https://www.fotmob.com/api/playerData?id={player_id}'
 
-    try:
-        # Perform the GET request
-        response = requests.get(api_url)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        
-        # Return the JSON response as a dictionary
-        return response.json()
-    
-    except requests.exceptions.RequestException as e:
-        print(f'Error during request: {e}')
+    response = _FOTMOB_SESSION.get(api_url, timeout=15)
+    response.raise_for_status()  # Raise an exception for HTTP errors
+
+    data = response.json()
+    _store_player_data(player_id, data)
+    return data
+
+
+async def _get_player_data_many(player_ids, delay):
+    """
+    Fetches the data of a list of players concurrently, requesting only the players that are not cached.
+
+    Args:
+        player_ids (list): The IDs of the players.
+        delay (int): The number of seconds to wait between requests to avoid overwhelming the server.
+
+    Returns:
+        list: The data of each player, or the exception raised while fetching it, in the same order as `player_ids`.
+    """
+    missing = list(dict.fromkeys(str(player_id) for player_id in player_ids if _cached_player_data(str(player_id)) is None))
+    responses = await _fetch_all([f'https://www.fotmob.com/api/playerData?id={player_id}' for player_id in missing], delay)
+
+    errors = {}
+    for player_id, text in zip(missing, responses):
+        try:
+            if isinstance(text, Exception):
+                raise text
+
+            _store_player_data(player_id, json.loads(text))
+
+        except Exception as e:
+            errors[player_id] = e
+
+    _save_player_data_cache()
+
+    return [errors.get(str(player_id)) or _PLAYER_DATA_CACHE[str(player_id)]['data'] for player_id in player_ids]
+
+
+def _cached_player_data(player_id):
+    """
+    Looks up the data of a player in the player data cache.
+
+    Args:
+        player_id (str): The ID of the player.
+
+    Returns:
+        dict: The player's data, or None if it is not cached or has expired.
+    """
+    entry = _PLAYER_DATA_CACHE.get(player_id)
+
+    if entry is None or time.time() - entry['fetched_at'] >= _PLAYER_DATA_CACHE_EXPIRE:
         return None
+
+    return entry['data']
+
+
+def _store_player_data(player_id, data):
+    """
+    Adds the data of a player to the player data cache, along with the time it was fetched.
+
+    Args:
+        player_id (str): The ID of the player.
+        data (dict): The player's data.
+    """
+    _PLAYER_DATA_CACHE[player_id] = {'fetched_at': time.time(), 'data': data}
+
+
+@atexit.register
+def _save_player_data_cache():
+    """
+    Writes the player data cache to its file, so it can be reused in later runs.
+    """
+    if not _PLAYER_DATA_CACHE:
+        return
+
+    with open(_PLAYER_DATA_CACHE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(_PLAYER_DATA_CACHE, f)
@@ -1,32 +1,109 @@
+import cachetools
+import functools
+import json
+import numpy as np
 import pandas as pd
 import re
 import requests
+import requests_cache
+import threading
 import time
 import os
-from bs4 import BeautifulSoup
-from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from bs4 import BeautifulSoup, SoupStrainer
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from _pvd_utils import _DATA_DIR, _check_output_format, _write_output
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # Fall back to the standard library parser
+    _json_loads = json.loads
+
+
+# Lines and positions of the starting lineup, in the order the players are listed
+_LINES = np.array(['por', 'def', 'mid_0', 'mid_1', 'mid_2', 'ata', None], dtype=object)
+_LINE_POSITIONS = np.array(['POR', 'DEF', 'MED', 'MED', 'MED', 'ATA', None], dtype=object)
+
+# Columns of the lineups table
+_LINEUP_COLS = (
+    'event_id', 'player', 'id', 'jersey', 'position', 'substitute', 'minutes', 'order', 'line', 'lat', 'pos',
+    'local', 'team', 'formation', 'defense', 'midfield', 'attack', 'averageX', 'averageY', 'pointsCount'
+)
+
+# Types of the heatmap columns, coordinates and counts are small integers
+_HEATMAP_DTYPES = {
+    'x': 'int16',
+    'y': 'int16',
+    'count': 'int32',
+    'player_id': 'int32',
+    'league_id': 'int32',
+    'season_id': 'int32'
+}
+
+# Empty heatmap with the columns and types of the heatmaps, returned when there is no data
+_EMPTY_HEATMAP_DF = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in _HEATMAP_DTYPES.items()})
+
+# Pattern to extract the event ID from the event link
+_EVENT_ID_RE = re.compile(r'id:(\d+)')
+
+# Only the links of the pages are parsed, the rest of the document is skipped
+_LINKS_ONLY = SoupStrainer('a', href=True)
+
+# Number of threads performing requests at the same time
+_MAX_WORKERS = (os.cpu_count() or 1) * 5
+
+# On-disk cache of the responses, revalidated with the ETag/Last-Modified headers of the API
+_HTTP_CACHE = _DATA_DIR / '.http_cache_sofascore'
+_HTTP_CACHE_EXPIRE = 3600  # Seconds
+_FINISHED_EVENT_EXPIRE = timedelta(days=30)  # Finished events no longer change
+_HEATMAP_EXPIRE = timedelta(hours=24)  # Heatmaps change at most once per match day
+
+# Heatmaps fetched in the session, dropped when their on-disk response expires so they are refreshed
+_HEATMAP_CACHE = cachetools.TTLCache(maxsize=4096, ttl=_HEATMAP_EXPIRE.total_seconds())
+
+# Last heatmap fetched for each (player, league, season), returned when a later request fails
+_LAST_GOOD_HEATMAPS = cachetools.LRUCache(maxsize=4096)
+_HEATMAP_CACHE_LOCK = threading.Lock()  # The caches are not thread-safe, the workers share them
+
+# Session shared by the requests to the API, so the connections to the host are reused
+_SOFASCORE_SESSION = requests_cache.CachedSession(
+    _HTTP_CACHE,
+    backend='sqlite',
+    expire_after=_HTTP_CACHE_EXPIRE,
+    allowable_methods=('GET',),
+    cache_control=True,
+    stale_if_error=True
+)
+_SOFASCORE_SESSION.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Accept-Encoding': 'gzip, deflate'
+})
+_SOFASCORE_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=max(64, _MAX_WORKERS),
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+))
 
 
 # Main functions
 
 
-def get_teams_from_league(league_url):
+def get_teams_from_league(league_url, output_format='csv'):
     """
     Extracts team information from a Sofascore league URL.
 
     Args:
         league_url (str): The URL of the league page on Sofascore.
+        output_format (str): Format of the exported file, 'csv' or 'parquet'. Default is 'csv'.
 
     Returns:
         list: A list of dictionaries containing team details, including name, ID, logo, league, country, season, and link.
     """
+    _check_output_format(output_format)  # Fail before any request, not after the scrape
     teams_dic = []
-    seen_links = []
-    j = 0
 
     # Extract tournament_id and season_id from the URL
     parts = league_url.rstrip('/').split('/')
@@ -44,176 +121,108 @@ def get_teams_from_league(league_url):
     teams_name = standings['teams_name']
     teams_id = standings['teams_id']
 
-    try:
-        response = requests.get(league_url)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        links = soup.find_all('a', href=True)
-
-        for link in links:
-            href = link['href']
-
-            if href not in seen_links:
-                seen_links.append(href)
-
-                if '/es/equipo/futbol/' in href:
-                    full_link = 'https://www.sofascore.com' + href
+    # Get the page slug of every team concurrently, the standings only have names and IDs
+    with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+        teams_slug = list(executor.map(_get_team_slug, teams_id, teams_name))
 
-                    if j < len(teams_name):
-                        team_info = {
-                            'team': teams_name[j],
-                            'id': teams_id[j],
-                            'logo': f'https://api.sofascore.app/api/v1/team/{teams_id[j]}/image',
-                            'league': league,
-                            'country': country,
-                            'season': season,
-                            'link': full_link
-                        }
-                        teams_dic.append(team_info)
-                        j += 1
+    teams_dic = [
+        {
+            'team': team_name,
+            'id': team_id,
+            'logo': f'https://api.sofascore.app/api/v1/team/{team_id}/image',
+            'league': league,
+            'country': country,
+            'season': season,
+            'link': f'https://www.sofascore.com/es/equipo/futbol/{team_slug}/{team_id}'
+        }
+        for team_name, team_id, team_slug in zip(teams_name, teams_id, teams_slug)
+    ]
 
-    except requests.exceptions.RequestException as e:
-        print(f'Error during request: {e}')
-    
-    # Export to CSV
-    os.makedirs('data', exist_ok=True)
+    # Export to the data directory
     teams_df = pd.DataFrame(teams_dic)
-    teams_df.to_csv('data/sofascore_teams.csv', index=False, encoding='utf-8')
+    _write_output(teams_df, 'sofascore_teams', output_format)
 
     return teams_dic
 
 
-def get_events_from_league(league_url):
+def get_events_from_league(league_url, output_format='csv'):
     """
     Extracts event results from a Sofascore league URL.
 
     Args:
         league_url (str): The URL of the league page on Sofascore.
+        output_format (str): Format of the exported file, 'csv' or 'parquet'. Default is 'csv'.
 
     Returns:
         list: A list of dictionaries containing event details, including round number, season, and link.
     """
-    if not league_url.endswith(',tab:matches'):
-        league_url += ',tab:matches'
-    
-    # Set up the driver
-    driver = webdriver.Chrome()  # Or use `webdriver.Firefox()` if you are using Firefox
+    _check_output_format(output_format)  # Fail before any request, not after the scrape
     events_dic = []  # List to store each event result as a separate row
-    
-    try:
-        # Go to the URL
-        driver.get(league_url)
 
-        # Wait for the "By Rounds" tab to be clickable and click it
-        wait = WebDriverWait(driver, 30)
-        rounds_tab = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, 'div[data-tabid="2"]')))
-        rounds_tab.click()
+    # Extract tournament_id and season_id from the URL
+    parts = league_url.rstrip('/').split('/')
+    tournament_id = parts[-1].split('#id:')[0]
+    season_id = parts[-1].split('#id:')[1].split(',')[0]
 
-        # Wait for the content of the "By Rounds" tab to load
-        wait.until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, '[data-testid="event_cell"]')))
+    try:
+        # Get the current round, events are listed from it back to the first one
+        rounds = get_season_rounds(tournament_id, season_id)
+        current_round = rounds['currentRound']['round']
+        round_numbers = list(range(current_round, 0, -1))
 
-        # Get the season text
-        season_element = driver.find_element(By.CSS_SELECTOR, 'div.Box.Flex.eJCdjm.bnpRyo .Text.nZQAT')
-        season_text = season_element.text
-        
-        # Extract the season number from the text
-        season = season_text.split(' ')[-1]  # Get the last element after the space
+        # Fetch the events of every round concurrently, keeping the order of the rounds
+        with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+            responses = executor.map(lambda round_number: get_round_events(tournament_id, season_id, round_number), round_numbers)
 
-        # Initialize variables
-        round_number = None
-        
-        while True:
-            # Get the round text
-            round_container = driver.find_element(By.CSS_SELECTOR, 'div.Box.gRmPLj')
-            round_items = round_container.find_elements(By.CSS_SELECTOR, 'div.Text.nZQAT')
-            
-            selected_round = None
-            for item in round_items:
-                round_text = item.text
-                if 'Round' or 'Ronda' in round_text:
-                    selected_round = round_text
-                    break
-
-            # Extract the round number from the text
-            current_round_number = selected_round.split(' ')[-1] if selected_round else 'Not found'
-            
-            if current_round_number == 'Not found':
-                break
-            
-            round_number = int(current_round_number)
-            
-            # Extract event links for the current round
-            event_cells = driver.find_elements(By.CSS_SELECTOR, '[data-testid="event_cell"]')
-            for cell in event_cells:
-                href = cell.get_attribute('href')
-                if href and 'summary' not in href:  # Exclude links containing 'summary'
-                    
-                    # Extract tournament information
-                    event_id = re.search(r'#id:(\d+)', href).group(1)
-                    data = get_event_data(event_id)
-                    league = data['event']['tournament']['name']
-                    league_id = data['event']['tournament']['uniqueTournament']['id']
-                    season_id = data['event']['season']['id']
-                    country = data['event']['tournament']['category']['name']
-                    home_team_id = data['event']['homeTeam']['id']
-                    away_team_id = data['event']['awayTeam']['id']
+            for round_number, data in zip(round_numbers, responses):
+                for event in data.get('events', []):
+                    event_id = str(event['id'])
+                    link = f'https://www.sofascore.com/es/football/match/{event["slug"]}/{event["customId"]}#id:{event_id}'
 
                     round_result = {
                         'id': event_id,
-                        'league': league,
-                        'league_id': league_id,
-                        'country': country,
+                        'league': event['tournament']['name'],
+                        'league_id': event['tournament']['uniqueTournament']['id'],
+                        'country': event['tournament']['category']['name'],
                         'round': round_number,
-                        'season': season,
-                        'season_id': season_id,
-                        'home_team_id': home_team_id,
-                        'away_team_id': away_team_id,
-                        'link': href
+                        'season': event['season']['year'],
+                        'season_id': event['season']['id'],
+                        'home_team_id': event['homeTeam']['id'],
+                        'away_team_id': event['awayTeam']['id'],
+                        'link': link
                     }
 
                     events_dic.append(round_result)
 
-            # Check if we have reached round 1 and exit the loop if so
-            if round_number <= 1:
-                break
-
-            # Try to go to the previous round
-            try:
-                previous_round_button = driver.find_element(By.CSS_SELECTOR, 'button.Button.iCnTrv')
-                previous_round_button.click()
-                # Wait a moment for the page to load
-                WebDriverWait(driver, 10).until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, '[data-testid="event_cell"]')))
-            except Exception as e:
-                print(f"Error navigating to previous round: {e}")
-                break
-
-    finally:
-        # Close the browser
-        driver.quit()
+    except requests.exceptions.RequestException as e:
+        print(f'Error during request: {e}')
     
-    # Export to CSV
-    os.makedirs('data', exist_ok=True)
+    # Export to the data directory
     events_df = pd.DataFrame(events_dic)
-    events_df.to_csv('data/sofascore_events.csv', index=False, encoding='utf-8')
+    _write_output(events_df, 'sofascore_events', output_format)
 
     return events_dic
 
 
-def get_players_from_teams(teams, delay=5):
+def get_players_from_teams(teams, delay=5, output_format='csv'):
     """
     Extracts player information from team URLs on Sofascore.
 
     Args:
         teams (list): List of dictionaries, each containing team details and URL.
         delay (int): Time to wait (in seconds) between requests to avoid overloading the server. Default is 5 seconds.
+        output_format (str): Format of the exported file, 'csv' or 'parquet'. Default is 'csv'.
 
     Returns:
         list: A list of dictionaries with player information.
     """
+    _check_output_format(output_format)  # Fail before any request, not after the scrape
     players_dic = []  # List to store player information
-    repeated = []  # List to keep track of processed links
+    repeated = set()  # Set to keep track of processed links
+    limiter = TokenBucket(delay)  # Respect the delay between requests
 
     for team in teams:
-        time.sleep(delay)  # Respect the delay between requests
+        limiter.acquire()
 
         team_name = team['team']
         season = team['season']
@@ -222,15 +231,15 @@ def get_players_from_teams(teams, delay=5):
         url = team['link']
 
         # Make the request and parse the page content
-        response = requests.get(url)
-        soup = BeautifulSoup(response.content, 'html.parser')
+        response = _SOFASCORE_SESSION.get(url, timeout=10)
+        soup = BeautifulSoup(response.content, 'lxml', parse_only=_LINKS_ONLY)
         links = soup.find_all('a', href=True)
 
         for link in links:
             href = link['href']
 
             if href not in repeated:
-                repeated.append(href)
+                repeated.add(href)
 
                 if '/es/jugador/' in href:
                     full_link = 'https://www.sofascore.com' + href
@@ -251,55 +260,53 @@ def get_players_from_teams(teams, delay=5):
                     }
                     players_dic.append(player_info)
 
-    # Export to CSV
-    os.makedirs('data', exist_ok=True)
+    # Export to the data directory
     players_df = pd.DataFrame(players_dic)
-    players_df.to_csv('data/sofascore_players.csv', index=False, encoding='utf-8')
+    _write_output(players_df, 'sofascore_players', output_format)
 
     return players_dic
 
 
-def get_heatmap_from_players(players, delay=5):
+def get_heatmap_from_players(players, delay=5, output_format='csv'):
     """
     Fetches heatmap data for a list of players from Sofascore API.
 
     Args:
         players (list of dict): List of player dictionaries with 'player_id'.
         delay (int): Delay in seconds between API requests to avoid rate limiting.
+        output_format (str): Format of the exported file, 'csv' or 'parquet'. Default is 'csv'.
 
     Returns:
         DataFrame: Combined heatmap data for all players and tournaments.
     """
+    _check_output_format(output_format)  # Fail before any request, not after the scrape
     
-    dfs = []
+    raws = []  # Heatmap of every player, league, and season, one array per column
+    limiter = TokenBucket(delay)  # Respect the delay between players
+
+    def fetch_player(player_id):
+        # One token per player, its heatmaps are fetched right after its tournaments
+        limiter.acquire()
 
-    for player in players:
-        time.sleep(delay)
-        player_id = player['id']
-        
-        # Get tournaments for the current player
         try:
             tournaments = get_player_tournaments(player_id)
-        except:
-            continue
-        
-        # Loop through each tournament
-        for _, row in tournaments.iterrows():
-            league_id = row['tournaments_id']
-            season_id = row['season_id']
-
-            # Get heatmap for the current player, league, and season
-            try:
-                heatmap_tournament = get_heatmap(player_id, league_id, season_id)
-                dfs.append(heatmap_tournament)
-            except:
-                continue
-
-    # Concatenate all dataframes and save to CSV
-    if dfs:
-        os.makedirs('data', exist_ok=True)
-        heatmaps_df = pd.concat(dfs, ignore_index=True)
-        heatmaps_df.to_csv('data/sofascore_heatmap.csv', index=False, encoding='utf-8')
+        except Exception:
+            return []
+
+        return [
+            _fetch_heatmap_raw(player_id, league_id, season_id)
+            for league_id, season_id in zip(tournaments['tournaments_id'], tournaments['season_id'])
+        ]
+
+    # Get the tournaments and heatmaps of every player concurrently, the pool bounds the requests in flight
+    with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+        for player_raws in executor.map(fetch_player, [player['id'] for player in players]):
+            raws.extend(player_raws)
+
+    # Save the heatmaps of every player, league, and season
+    if raws:
+        heatmaps_df = _heatmaps_to_df(raws)
+        _write_output(heatmaps_df, 'sofascore_heatmap', output_format)
     else:
         heatmaps_df = pd.DataFrame()
         print("No heatmap data was collected.")
@@ -307,23 +314,26 @@ def get_heatmap_from_players(players, delay=5):
     return heatmaps_df
 
 
-def get_lineups_from_events(events, delay=5):
+def get_lineups_from_events(events, delay=5, output_format='csv'):
     """
     Processes a list of events to extract and organize lineup data and average player positions.
 
     Args:
         events (list): List of dictionaries containing event information.
         delay (int): Time to wait (in seconds) between requests to avoid overloading the server. Default is 5 seconds.
+        output_format (str): Format of the exported file, 'csv' or 'parquet'. Default is 'csv'.
 
     Returns:
         pd.DataFrame: A DataFrame containing the lineup data and average player positions for all processed events.
     """
-    dfs = []  # Initialize a list to store DataFrames for each event
+    _check_output_format(output_format)  # Fail before any request, not after the scrape
+    columns = {column: [] for column in _LINEUP_COLS}  # Arrays of every team and event, by column
+    limiter = TokenBucket(delay)  # Respect the delay between requests
 
     for i in range(len(events)):
-        time.sleep(delay)  # Wait before making the next request
+        limiter.acquire()  # Wait only if the previous request was less than `delay` seconds ago
 
-        event = re.search(r'id:(\d+)', events[i]['link'])
+        event = _EVENT_ID_RE.search(events[i]['link'])
         event_id = event.group(1) if event else 'unknown'
         
         try:
@@ -367,177 +377,122 @@ def get_lineups_from_events(events, delay=5):
                     away_mid_1 = int(away_groups_formation[1])
                     away_mid_2 = 0
 
-                # Initialize lists to store player data
-                home = []
-                away = []
-                home_avg = []
-                away_avg = []
-
-                # Process home team players
-                for j in range(len(lineups['home']['players'])):
-                    player = lineups['home']['players'][j]
-                    name = player['player']['name']
-                    id = player['player']['id']
-                    jersey = player['shirtNumber']
-                    position = player.get('position', '')
-                    substitute = player['substitute']
-                    minutes = player.get('statistics', {}).get('minutesPlayed', 0)
-
-                    if j < len(average_positions['home']):
-                        avg_player = average_positions['home'][j]
-                        avg_id = avg_player['player']['id']
-                        averageX = avg_player['averageX']
-                        averageY = avg_player['averageY']
-                        pointsCount = avg_player['pointsCount']
-
-                    order = j + 1
-                    line, lat, pos = determine_position(order, home_def, home_mid_0, home_mid_1, home_mid_2, home_ata, substitute)
-                    
-                    # Append player data to home list
-                    home.append([name, id, jersey, position, substitute, minutes, order, line, lat, pos])
-                    home_avg.append([avg_id, averageX, averageY, pointsCount])
-
-                # Process away team players
-                for k in range(len(lineups['away']['players'])):
-                    player = lineups['away']['players'][k]
-                    name = player['player']['name']
-                    id = player['player']['id']
-                    jersey = player['shirtNumber']
-                    position = player.get('position', '')
-                    substitute = player['substitute']
-                    minutes = player.get('statistics', {}).get('minutesPlayed', 0)
-
-                    if k < len(average_positions['away']):
-                        avg_player = average_positions['away'][k]
-                        avg_id = avg_player['player']['id']
-                        averageX = avg_player['averageX']
-                        averageY = avg_player['averageY']
-                        pointsCount = avg_player['pointsCount']
-
-                    order = k + 1
-                    line, lat, pos = determine_position(order, away_def, away_mid_0, away_mid_1, away_mid_2, away_ata, substitute)
-
-                    # Append player data to away list
-                    away.append([name, id, jersey, position, substitute, minutes, order, line, lat, pos])
-                    away_avg.append([avg_id, averageX, averageY, pointsCount])
-
-                # Create DataFrames for home and away teams
-                home_df = pd.DataFrame(home, columns=['player', 'id', 'jersey', 'position', 'substitute', 'minutes', 'order', 'line', 'lat', 'pos'])
-                home_df['local'] = 'Home'
-                home_df['team'] = data['event']['homeTeam']['shortName']
-                home_df['formation'] = home_formation
-                home_df['defense'] = home_def
-                home_df['midfield'] = home_mid_0 + home_mid_1 + home_mid_2
-                home_df['attack'] = home_ata
-
-                away_df = pd.DataFrame(away, columns=['player', 'id', 'jersey', 'position', 'substitute', 'minutes', 'order', 'line', 'lat', 'pos'])
-                away_df['local'] = 'Away'
-                away_df['team'] = data['event']['awayTeam']['shortName']
-                away_df['formation'] = away_formation
-                away_df['defense'] = away_def
-                away_df['midfield'] = away_mid_0 + away_mid_1 + away_mid_2
-                away_df['attack'] = away_ata
-
-                # Create DataFrame for average player positions
-                home_avg_position = pd.DataFrame(home_avg, columns=['avg_id', 'averageX', 'averageY', 'pointsCount'])
-                away_avg_position = pd.DataFrame(away_avg, columns=['avg_id', 'averageX', 'averageY', 'pointsCount'])
-                df_avg_position = pd.concat([home_avg_position, away_avg_position], ignore_index=True)
-                df_avg_position.rename(columns={'avg_id': 'id'}, inplace=True)
-
-                # Merge lineup data with average position data
-                df = pd.concat([home_df, away_df], ignore_index=True)
-                df_merged = pd.merge(df, df_avg_position, on='id', how='left')
-
-                # Append the DataFrame to the list
-                dfs.append(df_merged)
+                # Average position of every player of the event, by player ID
+                avg_positions = {
+                    avg_player['player']['id']: (avg_player['averageX'], avg_player['averageY'], avg_player['pointsCount'])
+                    for avg_player in average_positions.get('home', []) + average_positions.get('away', [])
+                }
+
+                teams = [
+                    ('Home', lineups['home']['players'], data['event']['homeTeam']['shortName'], home_formation,
+                     (home_def, home_mid_0, home_mid_1, home_mid_2, home_ata)),
+                    ('Away', lineups['away']['players'], data['event']['awayTeam']['shortName'], away_formation,
+                     (away_def, away_mid_0, away_mid_1, away_mid_2, away_ata))
+                ]
+
+                # Process the players of both teams, keeping the columns only if the whole event succeeds
+                event_columns = []
+
+                for local, players, team, formation, counts in teams:
+                    team_columns = _players_to_soa(players, avg_positions, counts)
+                    n = len(players)
+
+                    team_columns['event_id'] = np.full(n, event_id, dtype=object)
+                    team_columns['local'] = np.full(n, local, dtype=object)
+                    team_columns['team'] = np.full(n, team, dtype=object)
+                    team_columns['formation'] = np.full(n, formation, dtype=object)
+                    team_columns['defense'] = np.full(n, counts[0], dtype=np.int32)
+                    team_columns['midfield'] = np.full(n, sum(counts[1:4]), dtype=np.int32)
+                    team_columns['attack'] = np.full(n, counts[4], dtype=np.int32)
+                    event_columns.append(team_columns)
+
+                for team_columns in event_columns:
+                    for column in _LINEUP_COLS:
+                        columns[column].append(team_columns[column])
 
         except Exception as e:
             print(f"Error in processing lineup for event {event_id}: {e}")
 
-    # Concatenate all DataFrames into one and save to CSV
-    os.makedirs('data', exist_ok=True)
-    lineups_df = pd.concat(dfs, ignore_index=True)
-    lineups_df.to_csv('data/sofascore_lineup.csv', index=False, encoding='utf-8')
+    # Build the lineups DataFrame once, from the arrays of every team and event
+    if columns['id']:
+        lineups_df = pd.DataFrame({column: np.concatenate(arrays) for column, arrays in columns.items()})
+    else:
+        lineups_df = pd.DataFrame(columns=list(_LINEUP_COLS))
+
+    # Save to the data directory
+    _write_output(lineups_df, 'sofascore_lineup', output_format)
 
     return lineups_df
 
 
-def get_results_from_events(events, delay=5):
+def get_results_from_events(events, delay=5, output_format='csv'):
     """
     Extracts match results from a list of events and returns a DataFrame.
 
     Args:
         events (list): A list of event dictionaries, each containing an 'id'.
         delay (int, optional): Delay in seconds between requests. Default is 5 seconds.
+        output_format (str): Format of the exported file, 'csv' or 'parquet'. Default is 'csv'.
 
     Returns:
         pd.DataFrame: A DataFrame containing match results for each event.
     """
-    # List to store DataFrames for each event
-    dfs = []
-
-    for event in events:
-        # Respect the delay between requests to avoid overloading the server
-        time.sleep(delay)
-
-        # Extract the event ID from the event dictionary
-        event_id = event['id']
-
-        # Fetch event data using the event ID
-        event_data = get_event_data(event_id)
-        status = event_data['event']['status']['type']
-
-        if status == 'finished':
-            # Extract necessary details from the event data
-            homeTeam_name = event_data['event']['homeTeam']['shortName']
-            homeTeam_id = event_data['event']['homeTeam']['id']
-            homeScore = int(event_data['event']['homeScore']['display'])
-            awayTeam_name = event_data['event']['awayTeam']['shortName']
-            awayTeam_id = event_data['event']['awayTeam']['id']
-            awayScore = int(event_data['event']['awayScore']['display'])
-
-            # Create a dictionary for the home team
-            home_dic = {
-                'event_id': event_id,
-                'team': homeTeam_name,
-                'team_id': homeTeam_id,
-                'score_for': homeScore,
-                'score_against': awayScore,
-                'win': homeScore > awayScore,
-                'draw': homeScore == awayScore,
-                'loose': homeScore < awayScore,
-                'local': 'Home'
-            }
-
-            # Create a dictionary for the away team
-            away_dic = {
-                'event_id': event_id,
-                'team': awayTeam_name,
-                'team_id': awayTeam_id,
-                'score_for': awayScore,
-                'score_against': homeScore,
-                'win': awayScore > homeScore,
-                'draw': awayScore == homeScore,
-                'loose': awayScore < homeScore,
-                'local': 'Away'
-            }
-
-            # Convert the dictionaries into DataFrames
-            home_df = pd.DataFrame([home_dic])
-            away_df = pd.DataFrame([away_dic])
-
-            # Concatenate the home and away DataFrames into a single DataFrame
-            df = pd.concat([home_df, away_df], ignore_index=True)
-
-            # Append the DataFrame to the list
-            dfs.append(df)
-
-    # Concatenate all the DataFrames into one final DataFrame
-    results_df = pd.concat(dfs, ignore_index=True)
-
-    # Export the final DataFrame to a CSV file
-    os.makedirs('data', exist_ok=True)
-    results_df.to_csv('data/sofascore_results.csv', index=False, encoding='utf-8')
+    _check_output_format(output_format)  # Fail before any request, not after the scrape
+    raw = []  # List to store one tuple per finished event
+    limiter = TokenBucket(delay)  # Respect the delay between requests to avoid overloading the server
+
+    def fetch(event_id):
+        limiter.acquire()
+        return get_event_data(event_id)
+
+    # Fetch the data of every event concurrently, keeping the order of the events
+    event_ids = [event['id'] for event in events]
+
+    with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+        for event_id, event_data in zip(event_ids, executor.map(fetch, event_ids)):
+            event = event_data['event']
+
+            if event['status']['type'] == 'finished':
+                # Extract necessary details from the event data
+                raw.append((
+                    event_id,
+                    event['homeTeam']['id'],
+                    event['awayTeam']['id'],
+                    event['homeTeam']['shortName'],
+                    event['awayTeam']['shortName'],
+                    int(event['homeScore']['display']),
+                    int(event['awayScore']['display'])
+                ))
+
+    events_df = pd.DataFrame(raw, columns=['event_id', 'home_id', 'away_id', 'home_name', 'away_name', 'home_score', 'away_score'])
+
+    # One row for the home team and one for the away team of every event
+    home_df = pd.DataFrame({
+        'event_id': events_df['event_id'],
+        'team': events_df['home_name'],
+        'team_id': events_df['home_id'],
+        'score_for': events_df['home_score'],
+        'score_against': events_df['away_score'],
+        'local': 'Home'
+    })
+    away_df = pd.DataFrame({
+        'event_id': events_df['event_id'],
+        'team': events_df['away_name'],
+        'team_id': events_df['away_id'],
+        'score_for': events_df['away_score'],
+        'score_against': events_df['home_score'],
+        'local': 'Away'
+    })
+
+    # Interleave both teams in event order and compare the scores of all rows at once
+    results_df = pd.concat([home_df, away_df]).sort_index(kind='stable').reset_index(drop=True)
+    results_df['win'] = results_df['score_for'] > results_df['score_against']
+    results_df['draw'] = results_df['score_for'] == results_df['score_against']
+    results_df['loose'] = results_df['score_for'] < results_df['score_against']
+    results_df = results_df[['event_id', 'team', 'team_id', 'score_for', 'score_against', 'win', 'draw', 'loose', 'local']]
+
+    # Export the final DataFrame
+    _write_output(results_df, 'sofascore_results', output_format)
 
     return results_df
 
@@ -603,6 +558,119 @@ def determine_position(order, def_count, mid_0_count, mid_1_count, mid_2_count,
     return line, lat, pos
 
 
+def _determine_positions(substitutes, def_count, mid_0_count, mid_1_count, mid_2_count, ata_count):
+    """
+    Determines the position, line, and latitude of every player of a lineup at once.
+
+    Vectorized version of determine_position, the players are expected in lineup order.
+
+    Args:
+        substitutes (list): Whether each player is a substitute, in lineup order.
+        def_count (int): Number of defenders.
+        mid_0_count (int): Number of midfielders in the first group.
+        mid_1_count (int): Number of midfielders in the second group.
+        mid_2_count (int): Number of midfielders in the third group.
+        ata_count (int): Number of attackers.
+
+    Returns:
+        tuple: (lines, latitudes, positions) as arrays with one value per player.
+    """
+    counts = np.array([1, def_count, mid_0_count, mid_1_count, mid_2_count, ata_count])
+    bounds = np.cumsum(counts)  # Order of the last player of each line
+    substitutes = np.asarray(substitutes, dtype=bool)
+    orders = np.arange(1, len(substitutes) + 1)
+
+    # Index of the line of each player, len(counts) for players outside the starting lineup
+    idx = np.searchsorted(bounds, orders, side='left')
+    in_lineup = idx < len(counts)
+    line_idx = np.minimum(idx, len(counts) - 1)
+
+    # Position of each player within its line
+    starts = bounds - counts
+    lats = np.char.add(np.char.add((orders - starts[line_idx]).astype(str), '/'), counts[line_idx].astype(str))
+    lats = np.where(in_lineup, lats.astype(object), None)
+
+    lines = _LINES[idx]
+    positions = _LINE_POSITIONS[idx]
+    positions[~in_lineup & (orders > 11) & substitutes] = 'SUS'
+    positions[~in_lineup & (orders > 11) & ~substitutes] = 'RES'
+
+    return lines, lats, positions
+
+
+def _get_team_slug(team_id, team_name):
+    """
+    Gets the slug used in the Sofascore page of a team.
+
+    Args:
+        team_id (int): The unique identifier for the team.
+        team_name (str): Name of the team, used to build the slug if the request fails.
+
+    Returns:
+        str: The slug of the team.
+    """
+    try:
+        return get_team_data(team_id)['team']['slug']
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        print(f'Error fetching team {team_id}: {e}')
+        return team_name.lower().replace(' ', '-')
+
+
+def _players_to_soa(players, avg_positions, counts):
+    """
+    Converts the players of a lineup to one typed array per column.
+
+    Args:
+        players (list): List of player dictionaries of the lineup, in lineup order.
+        avg_positions (dict): Average (x, y, points count) of the players of the event, by player ID.
+        counts (tuple): Number of defenders, midfielders in each of the three groups, and attackers.
+
+    Returns:
+        dict: Arrays with the player details, position in the formation and average position.
+    """
+    n = len(players)
+    names = np.empty(n, dtype=object)
+    ids = np.empty(n, dtype=np.int32)
+    jerseys = np.empty(n, dtype=np.int32)
+    positions = np.empty(n, dtype=object)
+    substitutes = np.empty(n, dtype=bool)
+    minutes = np.empty(n, dtype=np.int32)
+    average_x = np.full(n, np.nan, dtype=np.float32)
+    average_y = np.full(n, np.nan, dtype=np.float32)
+    points_count = np.full(n, np.nan)  # NaN for players without average position, like the coordinates
+
+    for j, player in enumerate(players):
+        id = player['player']['id']
+        names[j] = player['player']['name']
+        ids[j] = id
+        jerseys[j] = player['shirtNumber']
+        positions[j] = player.get('position', '')
+        substitutes[j] = player['substitute']
+        minutes[j] = player.get('statistics', {}).get('minutesPlayed', 0)
+
+        if id in avg_positions:
+            average_x[j], average_y[j], points_count[j] = avg_positions[id]
+
+    # Determine the line, latitude and position of every player at once
+    lines, lats, pos = _determine_positions(substitutes, *counts)
+
+    return {
+        'player': names,
+        'id': ids,
+        'jersey': jerseys,
+        'position': positions,
+        'substitute': substitutes,
+        'minutes': minutes,
+        'order': np.arange(1, n + 1, dtype=np.int32),
+        'line': lines,
+        'lat': lats,
+        'pos': pos,
+        'averageX': average_x,
+        'averageY': average_y,
+        'pointsCount': points_count
+    }
+
+
 def create_team_df(players, formation, def_count, mid_0_count, mid_1_count, mid_2_count, ata_count, team_name, is_home):
     """
     Creates a DataFrame for a team based on players' data and formation.
@@ -622,6 +690,10 @@ def create_team_df(players, formation, def_count, mid_0_count, mid_1_count, mid_
         pd.DataFrame: DataFrame containing player details and team information.
     """
     team_data = []
+    lines, lats, positions = _determine_positions(
+        [player['substitute'] for player in players], def_count, mid_0_count, mid_1_count, mid_2_count, ata_count
+    )
+
     for j, player in enumerate(players):
         name = player['player']['name']
         id = player['player']['id']
@@ -631,7 +703,7 @@ def create_team_df(players, formation, def_count, mid_0_count, mid_1_count, mid_
         minutes = player.get('statistics', {}).get('minutesPlayed', 0)
         
         order = j + 1
-        line, lat, pos = determine_position(order, def_count, mid_0_count, mid_1_count, mid_2_count, ata_count, substitute)
+        line, lat, pos = lines[j], lats[j], positions[j]
 
         team_data.append([name, id, jersey, position, substitute, minutes, order, line, lat, pos])
 
@@ -657,9 +729,9 @@ def get_lineups(event_id):
         dict: The JSON response containing lineup information.
     """
     api_url = f'https://www.sofascore.com/api/v1/event/{event_id}/lineups'
-    response = requests.get(api_url)
+    response = _SOFASCORE_SESSION.get(api_url, timeout=10, expire_after=_FINISHED_EVENT_EXPIRE)  # Only requested for finished events
     response.raise_for_status()  # Ensure we raise an error for bad responses
-    return response.json()
+    return _json_loads(response.content)
 
 
 def get_average_positions(event_id):
@@ -673,9 +745,9 @@ def get_average_positions(event_id):
         dict: The JSON response containing average position information.
     """
     api_url = f'https://www.sofascore.com/api/v1/event/{event_id}/average-positions'
-    response = requests.get(api_url)
+    response = _SOFASCORE_SESSION.get(api_url, timeout=10, expire_after=_FINISHED_EVENT_EXPIRE)  # Only requested for finished events
     response.raise_for_status()  # Ensure we raise an error for bad responses
-    return response.json()
+    return _json_loads(response.content)
 
 
 def get_event_data(event_id):
@@ -685,19 +757,115 @@ def get_event_data(event_id):
     Parameters:
         event_id (int): The unique identifier for the event.
 
+    Returns:
+        dict: The JSON response containing event data.
+    """
+    return _get_event_data(str(event_id))
+
+
+@functools.lru_cache(maxsize=4096)
+def _get_event_data(event_id):
+    """
+    Requests the data of an event, caching the result for the session.
+
+    The cache is keyed only on the ID, so the results and the lineups of an event share one request.
+
+    Parameters:
+        event_id (str): The unique identifier for the event.
+
     Returns:
         dict: The JSON response containing event data.
     """
     api_url = f'https://www.sofascore.com/api/v1/event/{event_id}'
-    response = requests.get(api_url)
+    response = _SOFASCORE_SESSION.get(api_url, timeout=10)
+    response.raise_for_status()  # Ensure we raise an error for bad responses
+    data = _json_loads(response.content)
+
+    # Keep finished events cached for longer, as they no longer change
+    status = data.get('event', {}).get('status', {}).get('type')
+    if status == 'finished' and not getattr(response, 'from_cache', True):
+        _SOFASCORE_SESSION.cache.save_response(response, expires=datetime.now() + _FINISHED_EVENT_EXPIRE)
+
+    return data
+
+
+def get_team_data(team_id):
+    """
+    Retrieves general data for a given team from Sofascore.
+
+    Parameters:
+        team_id (int): The unique identifier for the team.
+
+    Returns:
+        dict: The JSON response containing team data.
+    """
+    api_url = f'https://www.sofascore.com/api/v1/team/{team_id}'
+    response = _SOFASCORE_SESSION.get(api_url, timeout=10)
+    response.raise_for_status()  # Ensure we raise an error for bad responses
+    return _json_loads(response.content)
+
+
+def get_season_rounds(tournament_id, season_id):
+    """
+    Retrieves the rounds of a tournament season from Sofascore, including the current one.
+
+    Parameters:
+        tournament_id (str): The unique identifier for the tournament.
+        season_id (str): The unique identifier for the season.
+
+    Returns:
+        dict: The JSON response containing round information.
+    """
+    api_url = f'https://www.sofascore.com/api/v1/unique-tournament/{tournament_id}/season/{season_id}/rounds'
+    response = _SOFASCORE_SESSION.get(api_url, timeout=10)
+    response.raise_for_status()  # Ensure we raise an error for bad responses
+    return _json_loads(response.content)
+
+
+def get_round_events(tournament_id, season_id, round_number):
+    """
+    Retrieves the events of a round of a tournament season from Sofascore.
+
+    Parameters:
+        tournament_id (str): The unique identifier for the tournament.
+        season_id (str): The unique identifier for the season.
+        round_number (int): The number of the round.
+
+    Returns:
+        dict: The JSON response containing the events of the round.
+    """
+    api_url = f'https://www.sofascore.com/api/v1/unique-tournament/{tournament_id}/season/{season_id}/events/round/{round_number}'
+    response = _SOFASCORE_SESSION.get(api_url, timeout=10)
     response.raise_for_status()  # Ensure we raise an error for bad responses
-    return response.json()
+    return _json_loads(response.content)
 
 
 def get_tournament_standing(tournament_id, season_id):
     """
     Fetches the standings of a specific tournament and season from Sofascore.
 
+    Args:
+        tournament_id (str): The unique identifier for the tournament.
+        season_id (str): The unique identifier for the season.
+
+    Returns:
+        dict: A dictionary containing league, country, season, team names, and team IDs.
+    """
+    try:
+        return _get_tournament_standing(tournament_id, season_id)
+
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f'Error fetching tournament standings: {e}')
+        return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _get_tournament_standing(tournament_id, season_id):
+    """
+    Fetches and summarizes the standings of a tournament season, caching the result for the session.
+
+    Errors are raised instead of cached, so a failed request is retried on the next call.
+
     Args:
         tournament_id (str): The unique identifier for the tournament.
         season_id (str): The unique identifier for the season.
@@ -707,30 +875,25 @@ def get_tournament_standing(tournament_id, season_id):
     """
     api_url = f'https://www.sofascore.com/api/v1/unique-tournament/{tournament_id}/season/{season_id}/standings/total'
 
-    try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        data = response.json()
+    response = _SOFASCORE_SESSION.get(api_url, timeout=10)
+    response.raise_for_status()
+    data = _json_loads(response.content)
 
-        league = data['standings'][0]['tournament']['name']
-        country = data['standings'][0]['tournament']['category']['name']
-        season = datetime.fromtimestamp(data['standings'][0]['updatedAtTimestamp']).year
+    league = data['standings'][0]['tournament']['name']
+    country = data['standings'][0]['tournament']['category']['name']
+    season = datetime.fromtimestamp(data['standings'][0]['updatedAtTimestamp']).year
 
-        teams_name = [row['team']['name'] for row in data['standings'][0]['rows']]
-        teams_id = [row['team']['id'] for row in data['standings'][0]['rows']]
+    teams_name = [row['team']['name'] for row in data['standings'][0]['rows']]
+    teams_id = [row['team']['id'] for row in data['standings'][0]['rows']]
 
-        return {
-            'league': league,
-            'country': country,
-            'season': season,
-            'teams_name': teams_name,
-            'teams_id': teams_id
-        }
+    return {
+        'league': league,
+        'country': country,
+        'season': season,
+        'teams_name': teams_name,
+        'teams_id': teams_id
+    }
 
-    except requests.exceptions.RequestException as e:
-        print(f'Error fetching tournament standings: {e}')
-        return None
-    
 
 def get_player_tournaments(player_id):
     """
@@ -746,9 +909,9 @@ def get_player_tournaments(player_id):
     tournaments = []
     api_url = f'https://www.sofascore.com/api/v1/player/{player_id}/statistics/seasons'
     
-    response = requests.get(api_url)
+    response = _SOFASCORE_SESSION.get(api_url, timeout=10)
     response.raise_for_status()
-    data = response.json()
+    data = _json_loads(response.content)
 
     current_year = str(datetime.now().year)
     
@@ -781,31 +944,187 @@ def get_heatmap(player_id, league_id, season_id):
     Returns:
         DataFrame: Contains heatmap data with coordinates (x, y) and count of actions.
     """
-    
-    heatmap = []
-    api_url = f'https://www.sofascore.com/api/v1/player/{player_id}/unique-tournament/{league_id}/season/{season_id}/heatmap/overall'
-    
+    return _heatmaps_to_df([_fetch_heatmap_raw(player_id, league_id, season_id)])
+
+
+def get_heatmaps_many(triples, max_workers=_MAX_WORKERS):
+    """
+    Fetches the heatmaps of many players, leagues and seasons concurrently.
+
+    Args:
+        triples (list of tuple): List of (player_id, league_id, season_id) to fetch the heatmap of.
+        max_workers (int): Maximum number of requests in flight at the same time.
+
+    Returns:
+        DataFrame: Heatmap data of all the triples, in the order given.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        raws = list(executor.map(lambda triple: _fetch_heatmap_raw(*triple), triples))
+
+    return _heatmaps_to_df(raws)
+
+
+def _fetch_heatmap_raw(player_id, league_id, season_id):
+    """
+    Fetches the heatmap of a player in a league and season as one array per column.
+
+    Heatmaps fetched in the last _HEATMAP_EXPIRE are reused. If the request fails, the last heatmap
+    fetched for the same player, league and season is returned instead, if it is still in the
+    bounded _LAST_GOOD_HEATMAPS store.
+
+    Args:
+        player_id (int): Player's unique identifier in Sofascore.
+        league_id (int): League's unique identifier in Sofascore.
+        season_id (int): Season's unique identifier in Sofascore.
+
+    Returns:
+        dict: Arrays with the coordinates (x, y) and count of actions, and the player, league and season IDs.
+            The arrays are empty if the request fails and there is no previous heatmap.
+    """
+    key = (player_id, league_id, season_id)
+
     try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        data = response.json()
-
-        if 'points' in data:
-            for point in data['points']:
-                x = point.get('x', 0)
-                y = point.get('y', 0)
-                count = point.get('count', 0)
-                heatmap.append([x, y, count])
-        else:
-            print(f"No heatmap data found for player {player_id} in league {league_id} and season {season_id}.")
-
-    except:
-        # Return an empty DataFrame with appropriate columns if an exception occurs
-        return pd.DataFrame(columns=['x', 'y', 'count', 'player_id', 'league_id', 'season_id'])
-
-    heatmap_df = pd.DataFrame(heatmap, columns=['x', 'y', 'count'])
-    heatmap_df['player_id'] = player_id
-    heatmap_df['league_id'] = league_id
-    heatmap_df['season_id'] = season_id
-    
-    return heatmap_df
\ No newline at end of file
+        raw = _request_heatmap_raw(player_id, league_id, season_id)
+
+    except (requests.exceptions.RequestException, ValueError) as e:
+        # Report the cause and fall back to the last good heatmap, or to empty arrays
+        print(f'Error fetching heatmap for player {player_id} in league {league_id} and season {season_id}: {e}')
+        with _HEATMAP_CACHE_LOCK:
+            last_good = _LAST_GOOD_HEATMAPS.get(key)
+        return last_good or _empty_heatmap_raw(player_id, league_id, season_id)
+
+    with _HEATMAP_CACHE_LOCK:
+        _LAST_GOOD_HEATMAPS[key] = raw
+    return raw
+
+
+@cachetools.cached(_HEATMAP_CACHE, lock=_HEATMAP_CACHE_LOCK)
+def _request_heatmap_raw(player_id, league_id, season_id):
+    """
+    Requests the heatmap of a player in a league and season, caching the result until it expires.
+
+    Errors are raised instead of cached, so a failed request is retried on the next call. The arrays
+    are read-only, as they are shared by every caller.
+
+    Args:
+        player_id (int): Player's unique identifier in Sofascore.
+        league_id (int): League's unique identifier in Sofascore.
+        season_id (int): Season's unique identifier in Sofascore.
+
+    Returns:
+        dict: Arrays with the coordinates (x, y) and count of actions, and the player, league and season IDs.
+    """
+    api_url = f'https://www.sofascore.com/api/v1/player/{player_id}/unique-tournament/{league_id}/season/{season_id}/heatmap/overall'
+
+    response = _SOFASCORE_SESSION.get(api_url, headers={'Accept': 'application/json'}, timeout=10, expire_after=_HEATMAP_EXPIRE)
+    response.raise_for_status()
+    data = _json_loads(response.content)
+
+    if 'points' not in data:
+        print(f"No heatmap data found for player {player_id} in league {league_id} and season {season_id}.")
+
+    # Points without coordinates (missing or null) cannot be placed on the pitch, skip them
+    points = [point for point in data.get('points') or () if point.get('x') is not None and point.get('y') is not None]
+
+    # Skip the allocation and the loop when there are no points
+    if not points:
+        return _empty_heatmap_raw(player_id, league_id, season_id)
+
+    # Fill one typed array per column in a single pass, missing or null counts default to 0
+    n = len(points)
+    xs = np.empty(n, dtype=np.int16)
+    ys = np.empty(n, dtype=np.int16)
+    counts = np.empty(n, dtype=np.int32)
+
+    for i, point in enumerate(points):
+        xs[i] = point['x']
+        ys[i] = point['y']
+        counts[i] = point.get('count') or 0
+
+    for array in (xs, ys, counts):
+        array.flags.writeable = False
+
+    return {
+        'x': xs,
+        'y': ys,
+        'count': counts,
+        'player_id': player_id,
+        'league_id': league_id,
+        'season_id': season_id
+    }
+
+
+def _empty_heatmap_raw(player_id, league_id, season_id):
+    """
+    Builds the raw heatmap of a player in a league and season without points.
+
+    Args:
+        player_id (int): Player's unique identifier in Sofascore.
+        league_id (int): League's unique identifier in Sofascore.
+        season_id (int): Season's unique identifier in Sofascore.
+
+    Returns:
+        dict: Empty arrays for the coordinates (x, y) and count of actions, and the player, league and season IDs.
+    """
+    return {
+        'x': _EMPTY_HEATMAP_DF['x'].to_numpy(),
+        'y': _EMPTY_HEATMAP_DF['y'].to_numpy(),
+        'count': _EMPTY_HEATMAP_DF['count'].to_numpy(),
+        'player_id': player_id,
+        'league_id': league_id,
+        'season_id': season_id
+    }
+
+
+def _heatmaps_to_df(raws):
+    """
+    Builds a single DataFrame from the raw heatmaps returned by _fetch_heatmap_raw.
+
+    Args:
+        raws (list of dict): Raw heatmaps, one per player, league and season.
+
+    Returns:
+        DataFrame: Heatmap data of all the raw heatmaps, in the order given.
+    """
+    # Heatmaps without points add no rows
+    raws = [raw for raw in raws if len(raw['x'])]
+
+    if not raws:
+        return _EMPTY_HEATMAP_DF.copy()
+
+    # Concatenate the arrays of every heatmap, with the IDs broadcast to the rows of each one
+    columns = {column: np.concatenate([raw[column] for raw in raws]) for column in ('x', 'y', 'count')}
+
+    for column in ('player_id', 'league_id', 'season_id'):
+        columns[column] = np.concatenate([np.full(len(raw['x']), raw[column], dtype=np.int32) for raw in raws])
+
+    return pd.DataFrame(columns)
+
+
+class TokenBucket:
+    """
+    Rate limiter shared by the threads performing requests to a host.
+
+    Requests are spaced at least the given interval apart, without waiting when enough time has already passed.
+
+    Args:
+        min_interval (float): Minimum number of seconds between two requests.
+    """
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self.next_slot = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Waits until a request can be performed without exceeding the rate.
+        """
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+
+            if wait > 0:
+                time.sleep(wait)
+
+            self.next_slot = max(now, self.next_slot) + self.min_interval
@@ -0,0 +1,50 @@
+import csv
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('httpx')
+pytest.importorskip('hishel')
+
+from _pvd_utils import CsvChunkWriter
+
+
+_SQUADS_CSV = Path(__file__).resolve().parents[1] / 'data' / 'fbref_squads.csv'
+
+
+def _read_header(file):
+    with open(file, encoding='utf-8', newline='') as f:
+        return next(csv.reader(f))
+
+
+def test_repeated_columns_are_kept(tmp_path):
+    df = pd.DataFrame([['a', 1, 0.5, 2, 0.25]], columns=['player', 'Gls.', 'xG', 'Gls.', 'xG'])
+
+    with CsvChunkWriter(tmp_path / 'out.csv') as writer:
+        writer.write(df)
+        writer.write(df)
+
+    assert _read_header(tmp_path / 'out.csv') == ['player', 'Gls.', 'xG', 'Gls.', 'xG']
+
+
+def test_later_columns_are_added(tmp_path):
+    with CsvChunkWriter(tmp_path / 'out.csv') as writer:
+        writer.write(pd.DataFrame({'player': ['a'], 'xG': [0.5]}))
+        writer.write(pd.DataFrame({'player': ['b'], 'minAdded': [3]}))
+
+    with open(tmp_path / 'out.csv', encoding='utf-8') as f:
+        assert f.read().splitlines() == ['player,xG,minAdded', 'a,0.5,', 'b,,3']
+
+
+def test_baseline_squads_header_survives(tmp_path):
+    header = _read_header(_SQUADS_CSV)
+    squads_df = pd.read_csv(_SQUADS_CSV, dtype=str, keep_default_na=False)
+    squads_df.columns = header
+
+    # Write one chunk per team, as get_squads_from_teams does
+    with CsvChunkWriter(tmp_path / 'fbref_squads.csv') as writer:
+        for _, team_df in squads_df.groupby('team', sort=False):
+            writer.write(team_df)
+
+    assert _read_header(tmp_path / 'fbref_squads.csv') == header